@@ -3,18 +3,47 @@ import sys
 import psutil
 import time
 import threading
+import atexit
+import heapq
 import shutil
 import subprocess
 from pytron import App
 
+# NVML bindings let us read GPU stats directly instead of spawning nvidia-smi
+# on every poll. Fall back to nvidia-smi when pynvml or the driver is missing.
+try:
+    import pynvml
+    pynvml.nvmlInit()
+    _gpu_handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+except Exception:
+    pynvml = None
+    _gpu_handles = []
 
-def _check_output_hidden(cmd):
-    """Run a command and return output while preventing a console window on Windows.
+# PATH lookup is invariant for the life of the process, so do it once
+_HAS_NVIDIA_SMI = shutil.which('nvidia-smi') is not None
+
+# Pseudo-processes Windows reports for idle CPU time; hidden from the list
+_IDLE_NAMES = frozenset({'System Idle Process', 'Idle'})
+
+# Disk usage barely changes between polls, so statvfs is only re-issued this often
+_DISK_REFRESH_SECONDS = 5.0
+
+# On Windows io_counters() costs a separate kernel query per process, so unless
+# the list is sorted by disk the per-process IO rate is only refreshed this often.
+_IO_STALE_NS = 5 * 1_000_000_000
+
+# nvidia-smi streams refresh every second; older readings are treated as gone
+# (the stream exited, or no process is using the GPU any more)
+_SMI_STALE_SECONDS = 2.5
+
+
+def _popen_hidden(cmd):
+    """Start a command with piped stdout while preventing a console window on Windows.
 
     Uses subprocess.CREATE_NO_WINDOW when available, otherwise falls back to
     STARTUPINFO flags to hide the window. Keeps output encoding consistent.
     """
-    kwargs = {'encoding': 'utf-8', 'stderr': subprocess.STDOUT}
+    kwargs = {'encoding': 'utf-8', 'stdout': subprocess.PIPE, 'stderr': subprocess.DEVNULL}
     if os.name == 'nt':
         create_no_window = getattr(subprocess, 'CREATE_NO_WINDOW', None)
         if create_no_window is not None:
@@ -24,7 +53,18 @@ def _check_output_hidden(cmd):
             si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
             si.wShowWindow = subprocess.SW_HIDE
             kwargs['startupinfo'] = si
-    return subprocess.check_output(cmd, **kwargs)
+    return subprocess.Popen(cmd, **kwargs)
+
+def _read_or_none(accessor):
+    """Call a psutil.Process accessor, returning None if access is denied.
+
+    Mirrors the ad_value=None behaviour of Process.as_dict() so protected
+    processes still show up with empty fields instead of being dropped.
+    """
+    try:
+        return accessor()
+    except (psutil.AccessDenied, psutil.ZombieProcess):
+        return None
 
 def main():
     # Ensure the app serves the correct frontend files when run
@@ -65,45 +105,165 @@ def main():
 
     # --- Backend Logic ---
 
-    def get_system_stats():
+    # GPU hardware doesn't change at runtime, so the name is only queried once
+    _gpu_name_cache = [None]
+
+    # Latest system stats and GPU snapshots, rebuilt by a background thread so
+    # the exposed functions never block on cpu_percent, NVML or nvidia-smi.
+    _sample_lock = threading.Lock()
+    _latest_stats = None
+    _latest_gpu = {
+        "stats": {"percent": 0, "name": "N/A", "memory": {"used": 0, "total": 0}},
+        "processes": {}
+    }
+
+    # Without NVML, long-running `nvidia-smi --loop-ms` children stream readings
+    # on their stdout instead of spawning a new nvidia-smi for every refresh.
+    _smi_streams = []
+    _smi_lock = threading.Lock()
+    _smi_latest = {"stats": None, "stats_time": 0.0, "processes": {}, "processes_time": 0.0}
+    # Compute-app rows of the iteration currently being read:
+    # [timestamp, monotonic time its first row arrived, {pid: used_memory_mb}]
+    _smi_pending_apps = [None, 0.0, {}]
+
+    def _on_smi_stats_line(line):
+        # Example line: NVIDIA GeForce GTX 1650, 14, 4096, 500
+        # GPU names can contain commas, so split the numeric fields off the right
+        parts = line.rsplit(',', 3)
+        if len(parts) != 4:
+            # nvidia-smi error messages such as "NVIDIA-SMI has failed ..."
+            return
+        vals = [float(x) for x in parts[1:]]
+        if _gpu_name_cache[0] is None:
+            _gpu_name_cache[0] = parts[0].strip()
+
+        stats = {
+            "percent": vals[0],
+            "name": _gpu_name_cache[0],
+            "memory": {
+                "total": vals[1] * 1024 * 1024, # MB to Bytes
+                "used": vals[2] * 1024 * 1024   # MB to Bytes
+            }
+        }
+        with _smi_lock:
+            _smi_latest["stats"] = stats
+            _smi_latest["stats_time"] = time.monotonic()
+
+    def _on_smi_apps_line(line):
+        # Example line: 2024/01/01 12:00:00.000, 1234, 500
+        # Every row of one loop iteration shares a timestamp, so a new timestamp
+        # means the previous iteration is complete and can be published. It is
+        # stamped with the time its rows arrived, so a group left over from
+        # before the GPU went idle is published as stale rather than fresh.
+        timestamp, pid, mem_mb = line.rsplit(',', 2)
+        if timestamp != _smi_pending_apps[0]:
+            if _smi_pending_apps[0] is not None:
+                with _smi_lock:
+                    _smi_latest["processes"] = _smi_pending_apps[2]
+                    _smi_latest["processes_time"] = _smi_pending_apps[1]
+            _smi_pending_apps[:] = [timestamp, time.monotonic(), {}]
+        pending = _smi_pending_apps[2]
+        pid = int(pid)
+        pending[pid] = pending.get(pid, 0) + float(mem_mb)
+
+    def _start_smi_stream(query, on_line):
+        proc = _popen_hidden(['nvidia-smi', *query, '--format=csv,noheader,nounits', '--loop-ms=1000'])
+        _smi_streams.append(proc)
+
+        def reader():
+            for line in iter(proc.stdout.readline, ''):
+                line = line.strip()
+                if line:
+                    try:
+                        on_line(line)
+                    except Exception:
+                        # e.g. "[N/A]" fields or "No running processes found";
+                        # never let one bad line stop draining the pipe
+                        pass
+
+        threading.Thread(target=reader, daemon=True).start()
+
+    def _stop_smi_streams():
+        for proc in _smi_streams:
+            try:
+                proc.kill()
+            except Exception:
+                pass
+
+    def query_gpu():
         """
-        Returns a dictionary with current system statistics.
+        Queries GPU utilization and per-process GPU memory.
         """
-        # Use a small interval to ensure we get an immediate reading.
-        # interval=None returns 0 on the first call and relies on the time since the last call,
-        # which can sometimes be unreliable if calls are sporadic.
-        cpu_percent = psutil.cpu_percent(interval=0.1)
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
-        
-        # GPU info using nvidia-smi if available
+        # GPU info using NVML, or nvidia-smi if available
         gpu_stats = {"percent": 0, "name": "N/A", "memory": {"used": 0, "total": 0}}
-        if shutil.which('nvidia-smi'):
+        if _gpu_handles:
             try:
-                # Get Name
-                name_output = _check_output_hidden([
-                    'nvidia-smi', '--query-gpu=name', '--format=csv,noheader'
-                ])
-                gpu_name = name_output.strip().split('\n')[0]
-
-                # Get Stats
-                stats_output = _check_output_hidden([
-                    'nvidia-smi', '--query-gpu=utilization.gpu,memory.total,memory.used', '--format=csv,noheader,nounits'
-                ])
-                # Example output: 14, 4096, 500
-                line = stats_output.strip().split('\n')[0]
-                vals = [float(x) for x in line.split(',')]
-                
+                h = _gpu_handles[0]
+                util = pynvml.nvmlDeviceGetUtilizationRates(h)
+                mem = pynvml.nvmlDeviceGetMemoryInfo(h)
+                if _gpu_name_cache[0] is None:
+                    gpu_name = pynvml.nvmlDeviceGetName(h)
+                    if isinstance(gpu_name, bytes):
+                        gpu_name = gpu_name.decode('utf-8', 'replace')
+                    _gpu_name_cache[0] = gpu_name
+                gpu_name = _gpu_name_cache[0]
+
                 gpu_stats = {
-                    "percent": vals[0],
+                    "percent": float(util.gpu),
                     "name": gpu_name,
                     "memory": {
-                        "total": vals[1] * 1024 * 1024, # MB to Bytes
-                        "used": vals[2] * 1024 * 1024   # MB to Bytes
+                        "total": mem.total, # Already in Bytes
+                        "used": mem.used
                     }
                 }
             except Exception:
                 pass
+        elif _smi_streams:
+            with _smi_lock:
+                if time.monotonic() - _smi_latest["stats_time"] < _SMI_STALE_SECONDS:
+                    gpu_stats = _smi_latest["stats"]
+
+        # GPU Memory Map (pid -> used_memory_mb)
+        gpu_map = {}
+        if _gpu_handles:
+            for h in _gpu_handles:
+                # A process using the GPU for both compute and graphics is listed
+                # twice with the same usage, so union per device before summing.
+                device_map = {}
+                # Some drivers/modes reject one of the queries (e.g. NotSupported);
+                # query each separately so that only loses its own rows.
+                for query in (pynvml.nvmlDeviceGetGraphicsRunningProcesses,
+                              pynvml.nvmlDeviceGetComputeRunningProcesses):
+                    try:
+                        for p in query(h):
+                            device_map[p.pid] = p.usedGpuMemory
+                    except pynvml.NVMLError:
+                        pass
+                for pid, used in device_map.items():
+                    # usedGpuMemory is None when the driver can't report it
+                    if used:
+                        gpu_map[pid] = gpu_map.get(pid, 0) + used / (1024 * 1024) # Bytes to MB
+        elif _smi_streams:
+            with _smi_lock:
+                # The apps stream prints nothing while no process uses the GPU,
+                # so a map that hasn't been refreshed recently is treated as empty.
+                if time.monotonic() - _smi_latest["processes_time"] < _SMI_STALE_SECONDS:
+                    gpu_map = _smi_latest["processes"]
+
+        return {"stats": gpu_stats, "processes": gpu_map}
+
+    # [last refresh time, psutil.disk_usage('/') result]
+    _disk_cache = [0.0, None]
+
+    def build_system_stats(cpu_percent, gpu_stats):
+        """
+        Returns a dictionary with current system statistics.
+        """
+        memory = psutil.virtual_memory()
+        now = time.monotonic()
+        if _disk_cache[1] is None or now - _disk_cache[0] > _DISK_REFRESH_SECONDS:
+            _disk_cache[:] = [now, psutil.disk_usage('/')]
+        disk = _disk_cache[1]
 
         return {
             "cpu": cpu_percent,
@@ -122,91 +282,165 @@ def main():
             "gpu": gpu_stats
         }
 
-    # Cache for IO rate calculation: {pid: {'bytes': total_bytes, 'time': timestamp}}
+    def _sampler_loop():
+        nonlocal _latest_stats, _latest_gpu
+        # psutil keeps the cpu_percent() baseline per thread, so prime it here and
+        # sleep before each sample so every window spans roughly one second.
+        psutil.cpu_percent(interval=None)
+        while True:
+            time.sleep(1.0)
+            try:
+                # interval=None is non-blocking and measures since the previous call
+                cpu = psutil.cpu_percent(interval=None)
+                snapshot = query_gpu()
+                stats = build_system_stats(cpu, snapshot["stats"])
+                with _sample_lock:
+                    _latest_stats = stats
+                    _latest_gpu = snapshot
+            except Exception:
+                # Skip this tick; a transient failure must not stop the sampler
+                pass
+
+    def get_system_stats():
+        """
+        Returns the most recent system statistics snapshot.
+        """
+        # Snapshots are never mutated once published, so the dict is shared as-is
+        with _sample_lock:
+            return _latest_stats
+
+    # Cache for IO rate calculation: {pid: (total_bytes, monotonic_ns, bytes_per_sec)}
+    # total_bytes is None when io_counters() was denied for that process.
     io_cache = {}
 
+    # Cache of Process objects reused across polls: {pid: psutil.Process}
+    # Reusing them keeps cpu_percent() deltas and the cached create_time intact.
+    proc_cache = {}
+
     def get_processes(sort_by='cpu'):
         """
         Returns a list of running processes sorted by the given criteria.
         """
-        nonlocal io_cache
-        processes = []
         cpu_count = psutil.cpu_count() or 1
-        current_time = time.time()
+        # One timestamp for the whole walk; every process shares it
+        now_ns = time.monotonic_ns()
+        lazy_io = psutil.WINDOWS and sort_by != 'disk'
 
         # GPU Memory Map (pid -> used_memory_mb)
-        gpu_map = {}
-        if shutil.which('nvidia-smi'):
-            try:
-                # Get GPU memory usage per process
-                output = _check_output_hidden([
-                    'nvidia-smi', '--query-compute-apps=pid,used_memory', '--format=csv,noheader,nounits'
-                ])
-                for line in output.strip().split('\n'):
-                    if line:
-                        parts = line.split(',')
-                        if len(parts) == 2:
-                            try:
-                                pid = int(parts[0])
-                                mem_mb = float(parts[1])
-                                gpu_map[pid] = mem_mb
-                            except ValueError:
-                                pass
-            except Exception:
-                pass
+        with _sample_lock:
+            gpu_map = _latest_gpu["processes"]
+
+        # One list per field (structure of arrays); dicts are only built for
+        # the processes that are actually returned, and only carry the fields
+        # the process list renders.
+        pids = []
+        names = []
+        cpu_percents = []
+        memory_percents = []
+        disk_ios = []
+        gpu_memories = []
 
-        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'io_counters']):
+        all_pids = psutil.pids()
+        for pid in all_pids:
             try:
-                # Fetch process details as a dict
-                pinfo = proc.info
+                # Like process_iter(), cached PIDs aren't re-checked with is_running()
+                # (an extra /proc read per process per poll); exited PIDs are
+                # pruned against psutil.pids() after the walk.
+                proc = proc_cache.get(pid)
+                if proc is None:
+                    proc = psutil.Process(pid)
+                    proc_cache[pid] = proc
+
+                # Fetch process details; oneshot() coalesces the /proc reads
+                with proc.oneshot():
+                    name = _read_or_none(proc.name)
+
+                    # Filter out System Idle Process
+                    if name in _IDLE_NAMES:
+                        continue
 
-                # Filter out System Idle Process
-                if pinfo['name'] in ('System Idle Process', 'Idle'):
-                    continue
+                    cpu_percent = _read_or_none(proc.cpu_percent)
+                    memory_percent = _read_or_none(proc.memory_percent)
+
+                    prev = io_cache.get(pid)
+                    counters = None
+                    if not lazy_io or prev is None or now_ns - prev[1] >= _IO_STALE_NS:
+                        try:
+                            counters = proc.io_counters()
+                        except psutil.AccessDenied:
+                            # Remember the denial so protected processes are only
+                            # retried once the entry goes stale, like any other
+                            io_cache[pid] = (None, now_ns, 0)
+                        except AttributeError:
+                            pass
 
                 # Normalize CPU percent by number of cores
-                if pinfo['cpu_percent'] is not None:
-                    pinfo['cpu_percent'] = pinfo['cpu_percent'] / cpu_count
+                if cpu_percent is not None:
+                    cpu_percent = cpu_percent / cpu_count
                 
                 # Calculate IO Rate (Bytes/s)
                 io_rate = 0
-                if pinfo['io_counters']:
+                if counters:
                     # Sum of read_bytes and write_bytes
-                    total_io = pinfo['io_counters'].read_bytes + pinfo['io_counters'].write_bytes
+                    total_io = counters.read_bytes + counters.write_bytes
                     
-                    if pinfo['pid'] in io_cache:
-                        prev = io_cache[pinfo['pid']]
-                        time_diff = current_time - prev['time']
-                        if time_diff > 0:
-                            io_rate = (total_io - prev['bytes']) / time_diff
+                    if prev is not None and prev[0] is not None:
+                        prev_bytes, prev_ns, _ = prev
+                        if total_io >= prev_bytes:
+                            io_rate = (total_io - prev_bytes) * 1_000_000_000 // max(1, now_ns - prev_ns)
+                        else:
+                            # Counters never go backwards for one process, so the PID
+                            # was reused: start a fresh Process and IO baseline for it
+                            proc_cache[pid] = psutil.Process(pid)
                     
                     # Update cache
-                    io_cache[pinfo['pid']] = {'bytes': total_io, 'time': current_time}
-                
-                pinfo['disk_io'] = io_rate
-                
-                # Add GPU Memory
-                pinfo['gpu_memory'] = gpu_map.get(pinfo['pid'], 0)
+                    io_cache[pid] = (total_io, now_ns, io_rate)
+                elif lazy_io and prev is not None:
+                    # Counters were skipped this poll, reuse the last known rate
+                    io_rate = prev[2]
 
-                processes.append(pinfo)
+                pids.append(pid)
+                names.append(name)
+                cpu_percents.append(cpu_percent)
+                memory_percents.append(memory_percent)
+                disk_ios.append(io_rate)
+                gpu_memories.append(gpu_map.get(pid, 0))
             except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
                 pass
         
         # Clean up cache for dead processes
-        current_pids = set(p['pid'] for p in processes)
-        io_cache = {k: v for k, v in io_cache.items() if k in current_pids}
+        for k in io_cache.keys() - set(pids):
+            del io_cache[k]
+        for k in proc_cache.keys() - set(all_pids):
+            del proc_cache[k]
         
         # Sort
         key_map = {
-            'cpu': 'cpu_percent',
-            'memory': 'memory_percent',
-            'disk': 'disk_io', # Sort by IO rate
-            'gpu': 'gpu_memory'   # Sort by GPU memory
+            'cpu': cpu_percents,
+            'memory': memory_percents,
+            'disk': disk_ios, # Sort by IO rate
+            'gpu': gpu_memories   # Sort by GPU memory
         }
-        sort_key = key_map.get(sort_by, 'cpu_percent')
+        sort_col = key_map.get(sort_by, cpu_percents)
         
-        processes.sort(key=lambda p: p.get(sort_key) or 0, reverse=True)
-        return processes[:50] # Return top 50 to keep it snappy
+        # Access-denied fields are None; rank them as 0 up front so the heap key
+        # is a plain C-level list lookup instead of a Python lambda
+        if None in sort_col:
+            sort_col[:] = [v or 0 for v in sort_col]
+
+        # Return top 50 to keep it snappy; a heap avoids sorting the full list
+        top = heapq.nlargest(50, range(len(pids)), key=sort_col.__getitem__)
+        return [
+            {
+                'pid': pids[i],
+                'name': names[i],
+                'cpu_percent': cpu_percents[i],
+                'memory_percent': memory_percents[i],
+                'disk_io': disk_ios[i],
+                'gpu_memory': gpu_memories[i]
+            }
+            for i in top
+        ]
 
     def terminate_process(pid):
         """
@@ -224,6 +458,19 @@ def main():
     window.expose(get_processes)
     window.expose(terminate_process)
 
+    if not _gpu_handles and _HAS_NVIDIA_SMI:
+        try:
+            _start_smi_stream(['-i', '0', '--query-gpu=name,utilization.gpu,memory.total,memory.used'], _on_smi_stats_line)
+            _start_smi_stream(['--query-compute-apps=timestamp,pid,used_memory'], _on_smi_apps_line)
+        except OSError:
+            pass
+        atexit.register(_stop_smi_streams)
+
+    # Serve a real CPU reading until the sampler publishes its first one-second
+    # sample; a single short blocking sample at startup is enough for that.
+    _latest_stats = build_system_stats(psutil.cpu_percent(interval=0.1), _latest_gpu["stats"])
+    threading.Thread(target=_sampler_loop, daemon=True).start()
+
     # --- Background Monitor (Optional: Push updates via events) ---
     # Alternatively, the frontend can poll. Polling is often simpler for this kind of app.
     # But let's demonstrate the event system if we want real-time push.